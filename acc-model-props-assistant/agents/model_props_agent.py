@@ -1,7 +1,9 @@
 import os
 import asyncio
+import functools
 import json
 import jq
+import orjson
 from datetime import datetime
 from langchain_core.language_models.chat_models import BaseChatModel
 from langchain_core.prompts import ChatPromptTemplate
@@ -12,9 +14,9 @@ from langgraph.prebuilt import create_react_agent
 from typing import Annotated
 from aps.acc import ModelPropertiesClient
 
-with open(os.path.join(os.path.dirname(__file__), "SYSTEM_PROMPTS.md")) as f:
+with open(os.path.join(os.path.dirname(__file__), "SYSTEM_PROMPTS.md"), encoding="utf-8") as f:
     SYSTEM_PROMPTS = f.read().replace("{", "{{").replace("}", "}}")
-with open(os.path.join(os.path.dirname(__file__), "MPQL.md")) as f:
+with open(os.path.join(os.path.dirname(__file__), "MPQL.md"), encoding="utf-8") as f:
     MPQL = f.read().replace("{", "{{").replace("}", "}}")
 FILTER_CATEGORIES = ["__name__", "__category__", "Dimensions", "Materials and Finishes"]
 MAX_RESULTS = 256
@@ -26,7 +28,7 @@ class Agent:
         self._logs_path = os.path.join(cache_urn_dir, "logs.txt")
 
     def _log(self, message: str):
-        with open(self._logs_path, "a") as log:
+        with open(self._logs_path, "a", encoding="utf-8") as log:
             log.write(f"[{datetime.now().isoformat()}] {message}\n\n")
 
     async def prompt(self, prompt: str) -> list[str]:
@@ -43,8 +45,15 @@ class Agent:
                     self._log(message.pretty_repr())
         return responses
 
-async def _create_index(project_id: str, design_id: str, access_token: str, cache_dir: str):
-    client = ModelPropertiesClient(access_token)
+def _save_json(path: str, data):
+    with open(path + ".tmp", "wb") as f: f.write(orjson.dumps(data))
+    os.replace(path + ".tmp", path) # Atomic, so an interrupted write never leaves a truncated cache file behind
+
+@functools.lru_cache(maxsize=256)
+def _compile_jq(query: str):
+    return jq.compile(query) # Compiled programs are reusable, and agents tend to repeat the same queries
+
+async def _create_index(project_id: str, design_id: str, client: ModelPropertiesClient, cache_dir: str):
     index_path = os.path.join(cache_dir, "index.json")
     if not os.path.exists(index_path):
         payload = {"versions": [{ "versionUrn": design_id }]}
@@ -54,15 +63,14 @@ async def _create_index(project_id: str, design_id: str, access_token: str, cach
         while index["state"] == "PROCESSING":
             await asyncio.sleep(1)
             index = await client.get_index(project_id, index_id)
-        with open(index_path, "w") as f: json.dump(index, f)
-    with open(index_path) as f:
-        index = json.load(f)
+        _save_json(index_path, index)
+    with open(index_path, "rb") as f:
+        index = orjson.loads(f.read())
         if "errors" in index:
             raise Exception(f"Index creation failed with errors: {index["errors"]}")
         return index["indexId"]
 
-async def _list_index_properties(project_id: str, index_id: str, access_token: str, cache_dir: str):
-    client = ModelPropertiesClient(access_token)
+async def _list_index_properties(project_id: str, index_id: str, client: ModelPropertiesClient, cache_dir: str):
     fields_path = os.path.join(cache_dir, "fields.json")
     if not os.path.exists(fields_path):
         fields = await client.get_index_fields(project_id, index_id)
@@ -76,12 +84,11 @@ async def _list_index_properties(project_id: str, index_id: str, access_token: s
             if category not in categories:
                 categories[category] = {}
             categories[category][name] = key
-        with open(fields_path, "w") as f: json.dump(categories, f)
-    with open(fields_path) as f:
-        return json.load(f)
+        _save_json(fields_path, categories)
+    with open(fields_path, "rb") as f:
+        return orjson.loads(f.read())
 
-async def _query_index(project_id: str, index_id: str, query_str: str, access_token: str, cache_dir: str):
-    client = ModelPropertiesClient(access_token)
+async def _query_index(project_id: str, index_id: str, query_str: str, client: ModelPropertiesClient, cache_dir: str):
     payload = json.loads(query_str)
     query = await client.create_query(project_id, index_id, payload)
     while query["state"] == "PROCESSING":
@@ -97,19 +104,21 @@ async def _query_index(project_id: str, index_id: str, query_str: str, access_to
         raise Exception(f"Query failed with errors: {query["errors"]}")
 
 async def create_model_props_agent(project_id: str, version_id: str, access_token: str, cache_dir: str):
+    client = ModelPropertiesClient(access_token) # Shared by all tools so that connections are reused
+
     @tool
     async def create_index(
         design_id: Annotated[str, "The ID of the input design file hosted in Autodesk Construction Cloud."]
     ) -> str:
         """Builds a **Model Properties index** for a given design ID, including all available properties, and property values for individual design elements. Returns the ID of the created index."""
-        return await _create_index(project_id, design_id, access_token, cache_dir)
+        return await _create_index(project_id, design_id, client, cache_dir)
 
     @tool
     async def list_index_properties(
         index_id: Annotated[str, "The ID of the **Model Properties index** to list the available properties for."]
     ) -> dict:
         """Lists available properties for a **Model Properties index** of given ID. Returns a JSON with property categories, names, and keys."""
-        return await _list_index_properties(project_id, index_id, access_token, cache_dir)
+        return await _list_index_properties(project_id, index_id, client, cache_dir)
 
     @tool
     async def query_index(
@@ -117,7 +126,7 @@ async def create_model_props_agent(project_id: str, version_id: str, access_toke
         query_str: Annotated[str, "The Model Property Service Query Language query."],
     ) -> list[dict]:
         """Queries a **Model Properties index** of the given ID with a Model Property Service Query Language query. Returns a JSON list with properties of matching design elements."""
-        return await _query_index(project_id, index_id, query_str, access_token, cache_dir)
+        return await _query_index(project_id, index_id, query_str, client, cache_dir)
 
     @tool
     def execute_jq_query(
@@ -125,7 +134,7 @@ async def create_model_props_agent(project_id: str, version_id: str, access_toke
         input_json: Annotated[str, "The JSON input to process with the jq query."]
     ):
         """Processes the given JSON input with the given jq query, and returns the result as a JSON."""
-        return jq.compile(jq_query).input_text(input_json).all()
+        return _compile_jq(jq_query).input_text(input_json).all()
 
     llm = ChatOpenAI(model="gpt-4o")
     tools = [create_index, list_index_properties, query_index, execute_jq_query]
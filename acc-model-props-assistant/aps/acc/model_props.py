@@ -1,4 +1,4 @@
-import json
+import orjson
 import httpx
 
 class ModelPropertiesClient:
@@ -20,7 +20,7 @@ class ModelPropertiesClient:
         response = await self.client.get(url, headers={"Authorization": f"Bearer {self.access_token}"})
         if response.status_code >= 400:
             raise Exception(response.json())
-        return [json.loads(line) for line in response.text.splitlines()]
+        return [orjson.loads(line) for line in response.content.splitlines()]
 
     async def _post_json(self, url: str, json: dict) -> dict:
         response = await self.client.post(url, json=json, headers={"Authorization": f"Bearer {self.access_token}"})
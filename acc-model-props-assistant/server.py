@@ -1,21 +1,28 @@
 import os
+import asyncio
+import functools
 import base64
 import uvicorn
 from typing import Dict
 from pydantic import BaseModel
 from fastapi import FastAPI, Request, Depends, HTTPException
+from fastapi.responses import ORJSONResponse
 from fastapi.staticfiles import StaticFiles
 from agents import create_model_props_agent, Agent
 
 cache_dir = "__cache__"
-app = FastAPI()
-agents: Dict[str, Agent] = dict() # Cache agents by URN
+app = FastAPI(default_response_class=ORJSONResponse)
+agents: Dict[str, asyncio.Task[Agent]] = dict() # Cache agents by URN (as tasks so that concurrent requests share the creation)
 
 def _check_access(request: Request):
-    authorization = request.headers.get("authorization")
-    if not authorization:
+    scheme, _, access_token = request.headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not access_token:
         raise HTTPException(status_code=401)
-    return authorization.replace("Bearer ", "")
+    return access_token
+
+def _evict_failed_agent(key: str, task: asyncio.Task):
+    if (task.cancelled() or task.exception()) and agents.get(key) is task:
+        del agents[key] # Allow the next request to retry, even if nobody was awaiting the failed creation
 
 class PromptPayload(BaseModel):
     project_id: str
@@ -25,11 +32,13 @@ class PromptPayload(BaseModel):
 @app.post("/chatbot/prompt")
 async def chatbot_prompt(payload: PromptPayload, access_token: str = Depends(_check_access)) -> dict:
     urn = base64.b64encode(payload.version_id.encode()).decode().replace("/", "_").replace("=", "")
-    cache_urn_dir = os.path.join(cache_dir, urn)
-    os.makedirs(cache_urn_dir, exist_ok=True)
-    if not urn in agents:
-        agents[urn] = await create_model_props_agent(payload.project_id, payload.version_id, access_token, cache_urn_dir)
-    agent = agents[urn]
+    task = agents.get(urn)
+    if task is None:
+        cache_urn_dir = os.path.join(cache_dir, urn)
+        os.makedirs(cache_urn_dir, exist_ok=True)
+        task = agents[urn] = asyncio.create_task(create_model_props_agent(payload.project_id, payload.version_id, access_token, cache_urn_dir))
+        task.add_done_callback(functools.partial(_evict_failed_agent, urn))
+    agent = await asyncio.shield(task) # Don't cancel the shared creation if this request goes away
     responses = await agent.prompt(payload.prompt)
     return { "responses": responses }
 
@@ -1,6 +1,7 @@
 import os
-import json
+import functools
 import jq
+import orjson
 import faiss
 from datetime import datetime
 from langchain_community.docstore.in_memory import InMemoryDocstore
@@ -16,16 +17,18 @@ from langgraph.checkpoint.memory import MemorySaver
 from langgraph.prebuilt import create_react_agent
 from gql import Client, gql
 from gql.transport.aiohttp import AIOHTTPTransport
+from graphql import DocumentNode, GraphQLSchema
 
-with open(os.path.join(os.path.dirname(__file__), "SYSTEM_PROMPTS.md")) as f:
+with open(os.path.join(os.path.dirname(__file__), "SYSTEM_PROMPTS.md"), encoding="utf-8") as f:
     SYSTEM_PROMPTS = f.read().replace("{", "{{").replace("}", "}}")
-with open(os.path.join(os.path.dirname(__file__), "AECDM.graphql")) as f:
+with open(os.path.join(os.path.dirname(__file__), "AECDM.graphql"), encoding="utf-8") as f:
     AECDM_GRAPHQL = f.read().replace("{", "{{").replace("}", "}}")
 
 _embeddings = OpenAIEmbeddings(model="text-embedding-3-small")
 INDEX_DIMENSIONS = 1536
 AECDM_ENDPOINT = "https://developer.api.autodesk.com/aec/graphql"
 MAX_RESPONSE_SIZE = (1 << 12)
+_aecdm_schema: GraphQLSchema | None = None # Introspected once, then shared by all clients
 
 class Agent:
     def __init__(self, llm: BaseChatModel, prompt_template: ChatPromptTemplate, tools: list[BaseTool], cache_urn_dir: str):
@@ -34,7 +37,7 @@ class Agent:
         self._logs_path = os.path.join(cache_urn_dir, "logs.txt")
 
     def _log(self, message: str):
-        with open(self._logs_path, "a") as log:
+        with open(self._logs_path, "a", encoding="utf-8") as log:
             log.write(f"[{datetime.now().isoformat()}] {message}\n\n")
 
     async def prompt(self, prompt: str) -> list[str]:
@@ -51,11 +54,25 @@ class Agent:
                     self._log(message.pretty_repr())
         return responses
 
+def _save_json(path: str, data):
+    with open(path + ".tmp", "wb") as f: f.write(orjson.dumps(data))
+    os.replace(path + ".tmp", path) # Atomic, so an interrupted write never leaves a truncated cache file behind
+
+@functools.lru_cache(maxsize=256)
+def _compile_jq(query: str):
+    return jq.compile(query) # Compiled programs are reusable, and agents tend to repeat the same queries
+
+async def _execute_graphql_query(query: DocumentNode, access_token: str, variable_values: dict | None = None) -> dict:
+    global _aecdm_schema
+    transport = AIOHTTPTransport(url=AECDM_ENDPOINT, headers={"Authorization": f"Bearer {access_token}"})
+    client = Client(transport=transport, schema=_aecdm_schema, fetch_schema_from_transport=_aecdm_schema is None)
+    result = await client.execute_async(query, variable_values=variable_values)
+    _aecdm_schema = client.schema
+    return result
+
 async def _get_property_definitions(element_group_id: str, access_token: str, cache_dir: str) -> list[str]:
     props_cache_path = os.path.join(cache_dir, "props.json")
     if not os.path.exists(props_cache_path):
-        transport = AIOHTTPTransport(url=AECDM_ENDPOINT, headers={"Authorization": f"Bearer {access_token}"})
-        client = Client(transport=transport, fetch_schema_from_transport=True)
         query = gql("""
             query GetPropertyDefinitions($elementGroupId: ID!, $cursor:String) {
                 elementGroupAtTip(elementGroupId:$elementGroupId) {
@@ -77,16 +94,15 @@ async def _get_property_definitions(element_group_id: str, access_token: str, ca
             }
         """)
         property_definitions = []
-        response = await client.execute_async(query, variable_values={"elementGroupId": element_group_id})
+        response = await _execute_graphql_query(query, access_token, {"elementGroupId": element_group_id})
         property_definitions.extend(response["elementGroupAtTip"]["propertyDefinitions"]["results"])
         while response["elementGroupAtTip"]["propertyDefinitions"]["pagination"]["cursor"]:
             cursor = response["elementGroupAtTip"]["propertyDefinitions"]["pagination"]["cursor"]
-            response = await client.execute_async(query, variable_values={"elementGroupId": element_group_id, "cursor": cursor})
+            response = await _execute_graphql_query(query, access_token, {"elementGroupId": element_group_id, "cursor": cursor})
             property_definitions.extend(response["elementGroupAtTip"]["propertyDefinitions"]["results"])
-        with open(props_cache_path, "w") as f:
-            json.dump(property_definitions, f)
-    with open(props_cache_path) as f:
-        property_definitions = json.load(f)
+        _save_json(props_cache_path, property_definitions)
+    with open(props_cache_path, "rb") as f:
+        property_definitions = orjson.loads(f.read())
     return property_definitions
 
 async def _get_vector_store(element_group_id: str, access_token: str, cache_dir: str) -> VectorStore:
@@ -113,18 +129,16 @@ async def create_aecdm_agent(element_group_id: str, access_token: str, cache_dir
     @tool
     async def execute_graphql_query(query: str) -> dict:
         """Executes the given GraphQL query in Autodesk AEC Data Model API, and returns the result as a JSON."""
-        transport = AIOHTTPTransport(url=AECDM_ENDPOINT, headers={"Authorization": f"Bearer {access_token}"})
-        client = Client(transport=transport, fetch_schema_from_transport=True)
-        result = await client.execute_async(gql(query))
+        result = await _execute_graphql_query(gql(query), access_token)
         # Limit the response size to avoid overwhelming the LLM
-        if len(json.dumps(result)) > MAX_RESPONSE_SIZE:
+        if len(orjson.dumps(result)) > MAX_RESPONSE_SIZE:
             raise ValueError(f"Result is too large. Please refine your query.")
         return result
 
     @tool
     def execute_jq_query(query: str, input_json: str):
         """Processes the given JSON input with the given jq query, and returns the result as a JSON."""
-        return jq.compile(query).input_text(input_json).all()
+        return _compile_jq(query).input_text(input_json).all()
 
     vector_store = await _get_vector_store(element_group_id, access_token, cache_dir)
     retriever = vector_store.as_retriever(search_type="mmr", search_kwargs={"k": 8})
@@ -1,20 +1,27 @@
 import os
+import asyncio
+import functools
 import uvicorn
 from typing import Dict
 from pydantic import BaseModel
 from fastapi import FastAPI, Request, Depends, HTTPException
+from fastapi.responses import ORJSONResponse
 from fastapi.staticfiles import StaticFiles
 from agents import create_aecdm_agent, Agent
 
 cache_dir = "__cache__"
-app = FastAPI()
-agents: Dict[str, Agent] = dict() # Cache agents by element group ID
+app = FastAPI(default_response_class=ORJSONResponse)
+agents: Dict[str, asyncio.Task[Agent]] = dict() # Cache agents by element group ID (as tasks so that concurrent requests share the creation)
 
 def _check_access(request: Request):
-    authorization = request.headers.get("authorization")
-    if not authorization:
+    scheme, _, access_token = request.headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not access_token:
         raise HTTPException(status_code=401)
-    return authorization.replace("Bearer ", "")
+    return access_token
+
+def _evict_failed_agent(key: str, task: asyncio.Task):
+    if (task.cancelled() or task.exception()) and agents.get(key) is task:
+        del agents[key] # Allow the next request to retry, even if nobody was awaiting the failed creation
 
 class PromptPayload(BaseModel):
     element_group_id: str
@@ -23,11 +30,13 @@ class PromptPayload(BaseModel):
 @app.post("/chatbot/prompt")
 async def chatbot_prompt(payload: PromptPayload, access_token: str = Depends(_check_access)) -> dict:
     id = payload.element_group_id
-    cache_id_dir = os.path.join(cache_dir, id)
-    os.makedirs(cache_id_dir, exist_ok=True)
-    if id not in agents:
-        agents[id] = await create_aecdm_agent(id, access_token, cache_id_dir)
-    agent = agents[id]
+    task = agents.get(id)
+    if task is None:
+        cache_id_dir = os.path.join(cache_dir, id)
+        os.makedirs(cache_id_dir, exist_ok=True)
+        task = agents[id] = asyncio.create_task(create_aecdm_agent(id, access_token, cache_id_dir))
+        task.add_done_callback(functools.partial(_evict_failed_agent, id))
+    agent = await asyncio.shield(task) # Don't cancel the shared creation if this request goes away
     responses = await agent.prompt(payload.prompt)
     return { "responses": responses }
 
@@ -9,7 +9,7 @@ from langchain_openai import ChatOpenAI
 from langgraph.checkpoint.memory import MemorySaver
 from langgraph.prebuilt import create_react_agent
 
-with open(os.path.join(os.path.dirname(__file__), "SYSTEM_PROMPTS.md")) as f:
+with open(os.path.join(os.path.dirname(__file__), "SYSTEM_PROMPTS.md"), encoding="utf-8") as f:
     SYSTEM_PROMPTS = f.read().replace("{", "{{").replace("}", "}}")
 
 class Agent:
@@ -19,7 +19,7 @@ class Agent:
         self._logs_path = os.path.join(cache_urn_dir, "logs.txt")
 
     def _log(self, message: str):
-        with open(self._logs_path, "a") as log:
+        with open(self._logs_path, "a", encoding="utf-8") as log:
             log.write(f"[{datetime.now().isoformat()}] {message}\n\n")
 
     async def prompt(self, prompt: str) -> list[str]:
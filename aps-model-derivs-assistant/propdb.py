@@ -1,64 +1,67 @@
 import os
-import json
+import asyncio
 import sqlite3
+import orjson
 from langchain_community.utilities import SQLDatabase
 from aps import ModelDerivativesClient
 
+# Conversion factors to SI units (m, m^2, m^3) and degrees, keyed by unit name
+LENGTH_UNITS = {
+    "m": 1,
+    "cm": 0.01,
+    "mm": 0.001,
+    "km": 1000,
+    "in": 0.0254,
+    "ft": 0.3048,
+    "ft-and-fractional-in": 0.3048,
+    "yd": 0.9144,
+    "mi": 1609.34
+}
+AREA_UNITS = {
+    "m^2": 1,
+    "cm^2": 0.0001,
+    "mm^2": 0.000001,
+    "km^2": 1000000,
+    "in^2": 0.00064516,
+    "ft^2": 0.092903,
+    "yd^2": 0.836127,
+    "mi^2": 2589988.11
+}
+VOLUME_UNITS = {
+    "m^3": 1,
+    "cm^3": 0.000001,
+    "mm^3": 0.000000001,
+    "km^3": 1000000000,
+    "in^3": 0.0000163871,
+    "ft^3": 0.0283168,
+    "CF": 0.0283168,
+    "yd^3": 0.764555
+}
+ANGLE_UNITS = {
+    "degrees": 1,
+    "degree": 1,
+    "deg": 1,
+    "°": 1,
+    "radians": 57.2958,
+    "radian": 57.2958,
+    "rad": 57.2958,
+}
+
 def _parse_length(value):
-    units = {
-        "m": 1,
-        "cm": 0.01,
-        "mm": 0.001,
-        "km": 1000,
-        "in": 0.0254,
-        "ft": 0.3048,
-        "ft-and-fractional-in": 0.3048,
-        "yd": 0.9144,
-        "mi": 1609.34
-    }
     number, unit = value.split()
-    return float(number) * units[unit]
+    return float(number) * LENGTH_UNITS[unit]
 
 def _parse_area(value):
-    units = {
-        "m^2": 1,
-        "cm^2": 0.0001,
-        "mm^2": 0.000001,
-        "km^2": 1000000,
-        "in^2": 0.00064516,
-        "ft^2": 0.092903,
-        "yd^2": 0.836127,
-        "mi^2": 2589988.11
-    }
     number, unit = value.split()
-    return float(number) * units[unit]
+    return float(number) * AREA_UNITS[unit]
 
 def _parse_volume(value):
-    units = {
-        "m^3": 1,
-        "cm^3": 0.000001,
-        "mm^3": 0.000000001,
-        "km^3": 1000000000,
-        "in^3": 0.0000163871,
-        "ft^3": 0.0283168,
-        "CF": 0.0283168,
-        "yd^3": 0.764555
-    }
     number, unit = value.split()
-    return float(number) * units[unit]
+    return float(number) * VOLUME_UNITS[unit]
 
 def _parse_angle(value):
-    units = {
-        "degrees": 1,
-        "degree": 1,
-        "deg": 1,
-        "°": 1,
-        "radians": 57.2958,
-        "radian": 57.2958,
-        "rad": 57.2958,
-    }
     number, unit = value.split()
-    return float(number) * units[unit]
+    return float(number) * ANGLE_UNITS[unit]
 
 # Define the properties to extract from the model
 # (column name, column type, category name, property name, parsing function)
@@ -76,6 +79,31 @@ PROPERTIES = [
     ("material",    "TEXT", "Materials and Finishes",   "Structural Material",  lambda x: x),
 ]
 
+def _rows(props):
+    for row in props:
+        object_id = row["objectid"]
+        name = row["name"]
+        external_id = row["externalId"]
+        object_props = row["properties"]
+        insert_values = [object_id, name, external_id]
+        for (_, _, category_name, property_name, parse_func) in PROPERTIES:
+            if category_name in object_props and property_name in object_props[category_name]:
+                insert_values.append(parse_func(object_props[category_name][property_name]))
+            else:
+                insert_values.append(None)
+        yield insert_values
+
+def _save_json(path: str, data):
+    with open(path + ".tmp", "wb") as f: f.write(orjson.dumps(data))
+    os.replace(path + ".tmp", path) # Atomic, so an interrupted write never leaves a truncated cache file behind
+
+async def _load_or_fetch(cache_path: str, fetch):
+    if os.path.exists(cache_path):
+        with open(cache_path, "rb") as f: return orjson.loads(f.read())
+    data = await fetch()
+    _save_json(cache_path, data)
+    return data
+
 async def setup(urn: str, access_token: str, cache_urn_dir: str) -> SQLDatabase:
     propdb_path = os.path.join(cache_urn_dir, "props.sqlite3")
     if os.path.exists(propdb_path):
@@ -83,43 +111,25 @@ async def setup(urn: str, access_token: str, cache_urn_dir: str) -> SQLDatabase:
 
     model_derivative_client = ModelDerivativesClient(access_token)
 
-    views_path = os.path.join(cache_urn_dir, "views.json")
-    if not os.path.exists(views_path):
-        views = await model_derivative_client.list_model_views(urn)
-        with open(views_path, "w") as f: json.dump(views, f)
-    else:
-        with open(views_path, "r") as f: views = json.load(f)
+    views = await _load_or_fetch(os.path.join(cache_urn_dir, "views.json"), lambda: model_derivative_client.list_model_views(urn))
     view_guid = views[0]["guid"] # Use the first view
 
-    tree_path = os.path.join(cache_urn_dir, "tree.json")
-    if not os.path.exists(tree_path):
-        tree = await model_derivative_client.fetch_object_tree(urn, view_guid)
-        with open(tree_path, "w") as f: json.dump(tree, f)
-    else:
-        with open(tree_path, "r") as f: tree = json.load(f)
-
-    props_path = os.path.join(cache_urn_dir, "props.json")
-    if not os.path.exists(props_path):
-        props = await model_derivative_client.fetch_all_properties(urn, view_guid)
-        with open(props_path, "w") as f: json.dump(props, f)
-    else:
-        with open(props_path, "r") as f: props = json.load(f)
+    # The object tree and the properties only depend on the view, so download them concurrently
+    # (the task group cancels the other download if one of them fails)
+    async with asyncio.TaskGroup() as tg:
+        tree_task = tg.create_task(_load_or_fetch(os.path.join(cache_urn_dir, "tree.json"), lambda: model_derivative_client.fetch_object_tree(urn, view_guid)))
+        props_task = tg.create_task(_load_or_fetch(os.path.join(cache_urn_dir, "props.json"), lambda: model_derivative_client.fetch_all_properties(urn, view_guid)))
+    tree, props = tree_task.result(), props_task.result()
 
-    conn = sqlite3.connect(propdb_path)
+    # Build the database under a temporary name so that an interrupted build is never mistaken for a complete one
+    propdb_tmp_path = propdb_path + ".tmp"
+    if os.path.exists(propdb_tmp_path):
+        os.remove(propdb_tmp_path)
+    conn = sqlite3.connect(propdb_tmp_path)
     c = conn.cursor()
     c.execute(f"CREATE TABLE properties (object_id INTEGER, name TEXT, external_id TEXT, {", ".join([f'{column_name} {column_type}' for (column_name, column_type, _, _, _) in PROPERTIES])})")
-    for row in props:
-        object_id = row["objectid"]
-        name = row["name"]
-        external_id = row["externalId"]
-        object_props = row["properties"]
-        insert_values = [object_id, name, external_id]
-        for (_, _, category_name, property_name, parse_func) in PROPERTIES:
-            if category_name in object_props and property_name in object_props[category_name]:
-                insert_values.append(parse_func(object_props[category_name][property_name]))
-            else:
-                insert_values.append(None)
-        c.execute(f"INSERT INTO properties VALUES ({', '.join(['?' for _ in insert_values])})", insert_values)
+    c.executemany(f"INSERT INTO properties VALUES ({', '.join(['?'] * (3 + len(PROPERTIES)))})", _rows(props))
     conn.commit()
     conn.close()
+    os.replace(propdb_tmp_path, propdb_path)
     return SQLDatabase.from_uri(f"sqlite:///{propdb_path}")
\ No newline at end of file
@@ -1,21 +1,32 @@
 import os
+import asyncio
+import functools
 import propdb
 import uvicorn
 from fastapi import FastAPI, Request, Depends, HTTPException
+from fastapi.responses import ORJSONResponse
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
 from typing import Dict
 from agents import create_sqlite_agent, Agent
 
 cache_dir = "__cache__"
-app = FastAPI()
-agents: Dict[str, Agent] = dict() # Cache agents by URN
+app = FastAPI(default_response_class=ORJSONResponse)
+agents: Dict[str, asyncio.Task[Agent]] = dict() # Cache agents by URN (as tasks so that concurrent requests share the creation)
 
 def _check_access(request: Request):
-    authorization = request.headers.get("authorization")
-    if not authorization:
+    scheme, _, access_token = request.headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not access_token:
         raise HTTPException(status_code=401)
-    return authorization.replace("Bearer ", "")
+    return access_token
+
+async def _create_agent(urn: str, access_token: str, cache_urn_dir: str) -> Agent:
+    db = await propdb.setup(urn, access_token, cache_urn_dir)
+    return await create_sqlite_agent(db, cache_urn_dir)
+
+def _evict_failed_agent(key: str, task: asyncio.Task):
+    if (task.cancelled() or task.exception()) and agents.get(key) is task:
+        del agents[key] # Allow the next request to retry, even if nobody was awaiting the failed creation
 
 class PromptPayload(BaseModel):
     urn: str
@@ -24,12 +35,13 @@ class PromptPayload(BaseModel):
 @app.post("/chatbot/prompt")
 async def chatbot_prompt(payload: PromptPayload, access_token: str = Depends(_check_access)) -> dict:
     urn = payload.urn
-    cache_urn_dir = os.path.join(cache_dir, urn)
-    os.makedirs(cache_urn_dir, exist_ok=True)
-    if not urn in agents:
-        db = await propdb.setup(urn, access_token, cache_urn_dir)
-        agents[urn] = await create_sqlite_agent(db, cache_urn_dir)
-    agent = agents[urn]
+    task = agents.get(urn)
+    if task is None:
+        cache_urn_dir = os.path.join(cache_dir, urn)
+        os.makedirs(cache_urn_dir, exist_ok=True)
+        task = agents[urn] = asyncio.create_task(_create_agent(urn, access_token, cache_urn_dir))
+        task.add_done_callback(functools.partial(_evict_failed_agent, urn))
+    agent = await asyncio.shield(task) # Don't cancel the shared creation if this request goes away
     responses = await agent.prompt(payload.prompt)
     return { "responses": responses }
 